@@ -1,8 +1,19 @@
 from django.core.management.base import BaseCommand
 
-from andesOBIS.views import make_obis_events
+from andesOBIS.views import make_obis_events, write_obis_events
+from shared_models.utils import get_active_cruise
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event-csv",
+            help="Also write the OBIS event core to this CSV file",
+        )
+
     def handle(self, **options):
         print("exporting obis")
-        make_obis_events()
+        cruise = get_active_cruise()
+        make_obis_events(cruise)
+        if options["event_csv"]:
+            with open(options["event_csv"], "w", newline="") as fp:
+                write_obis_events(fp, cruise)
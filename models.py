@@ -1,21 +1,103 @@
 from django.db import models
 from datetime import datetime
+import functools
 import logging
-import pytz
+from zoneinfo import ZoneInfo
 
-from shapely import LineString
 from ecosystem_survey.models import Catch
 from shared_models.models import Cruise, Set
 from shared_models.utils import calc_nautical_dist
 
+logger = logging.getLogger(__name__)
+
 # Exceptions
 class NoCatchData(Exception):
     pass
+class NoFishingOperation(Exception):
+    pass
 class InvalidSpecies(Exception):
     pass
 class NoParentCruiseError(Exception):
     pass
 
+# unbound, saves the attribute lookup on every datetime formatted
+_strftime = datetime.strftime
+
+# precision of the Event start/end datetimes
+_DT_PRECISION_CHOICES = (
+    (1, "year"),
+    (2, "month"),
+    (3, "day"),
+    (4, "hour"),
+    (5, "minute"),
+    (6, "second"),
+    (7, "millisecond"),
+)
+
+# strftime formats indexed by datetime precision (see _DT_PRECISION_CHOICES)
+_OBIS_DT_FORMATS = (
+    None,
+    "%Y",
+    "%Y-%m",
+    "%Y-%m-%d",
+    "%Y-%m-%dT%H%z",
+    "%Y-%m-%dT%H:%M%z",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+)
+
+# strftime formats indexed by time precision, coarser than an hour there is no time to report
+_OBIS_TIME_FORMATS = (
+    None,
+    None,
+    None,
+    None,
+    "%H%z",
+    "%H:%M%z",
+    "%H:%M:%S%z",
+    "%H:%M:%S.%f%z",
+)
+
+
+# Constant OBIS metadata for the IML exports
+OBIS_LANGUAGE = "En"
+OBIS_LICENSE = "http://creativecommons.org/licenses/by/4.0/legalcode"
+OBIS_RIGHTS_HOLDER = "His Majesty the King in right of Canada, as represented by the Minister of Fisheries and Oceans"
+OBIS_INSTITUTION_ID = "https://edmo.seadatanet.org/report/4160"
+OBIS_INSTITUTION_CODE = "IML"
+
+# WoRMS LSID of a taxon, followed by its AphiaID
+_LSID_PREFIX = "urn:lsid:marinespecies.org:taxname:"
+
+# Hard-coded values of the cruise (top level) Event
+_CRUISE_DEFAULTS = {
+    "eventType": "Project",  # https://registry.gbif-uat.org/vocabulary/EventType/concepts
+    "continent": "North America",
+    "language": OBIS_LANGUAGE,
+    "coordinatePrecision": None,
+    "license": OBIS_LICENSE,
+    "rightsHolder": OBIS_RIGHTS_HOLDER,
+    "institutionID": OBIS_INSTITUTION_ID,
+    "institutionCode": OBIS_INSTITUTION_CODE,
+    "datasetName": None,
+    "countryCode": "CA",
+    "country": "Canada",
+}
+
+# memoized: events of a cruise share a handful of (datetime, precision) pairs.
+# Aware datetimes of the same instant are equal whatever their zone, the offset
+# is part of the key so they are not formatted with another entry's zone.
+@functools.lru_cache(maxsize=4096)
+def _format_obis_datetime(d: datetime, offset, precision: int) -> str:
+    # fast paths for the usual set (seconds) and cruise (day) precisions
+    if precision == 6:
+        return f"{d.year:04d}-{d.month:02d}-{d.day:02d}T{d.hour:02d}:{d.minute:02d}:{d.second:02d}{_strftime(d, '%z')}"
+    if precision == 3:
+        return f"{d.year:04d}-{d.month:02d}-{d.day:02d}"
+    if precision not in range(1, len(_OBIS_DT_FORMATS)):
+        raise ValueError("Precision not implemented")
+    return _strftime(d, _OBIS_DT_FORMATS[precision])
+
 class OBISTable(models.Model):
 
 
@@ -24,58 +106,66 @@ class OBISTable(models.Model):
         app_label = "andesOBIS"
 
     @classmethod
-    def obis_datetime_str(cls, dt: datetime, precision: int, tz=None) -> str:
-        if tz:
-            dt_in_user_timezone=dt.astimezone(pytz.timezone(tz))
+    def bulk_upsert(cls, objs: list, batch_size: int) -> list:
+        """
+        Insert objs in batches, rows already exported (same primary key) are
+        overwritten so that an export can be re-run.
+        """
+        return cls.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=[cls._meta.pk.name],
+            update_fields=[field.name for field in cls._meta.concrete_fields if not field.primary_key],
+        )
+
+    @staticmethod
+    def obis_datetime_str(dt: datetime, precision: int, tz=None) -> str:
+        # datetimes already in the requested zone are used as is
+        if tz and str(dt.tzinfo) != tz:
+            dt_in_user_timezone = dt.astimezone(ZoneInfo(tz))
         else:
             dt_in_user_timezone = dt
-        if precision == 1:
-            return dt_in_user_timezone.strftime("%Y")
-        elif precision == 2:
-            return dt_in_user_timezone.strftime("%Y-%m")
-        elif precision == 3:
-            return dt_in_user_timezone.strftime("%Y-%m-%d")
-        elif precision == 4:
-            return dt_in_user_timezone.strftime("%Y-%m-%dT%H%z")
-        elif precision == 5:
-            return dt_in_user_timezone.strftime("%Y-%m-%dT%H:%M%z")
-        elif precision == 6:
-            return dt_in_user_timezone.strftime("%Y-%m-%dT%H:%M:%S%z")
-        elif precision == 7:
-            return dt_in_user_timezone.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
-        else:
-            raise ValueError("Precision not implemented")
+        return _format_obis_datetime(dt_in_user_timezone, dt_in_user_timezone.utcoffset(), precision)
 
-    @classmethod
-    def obis_time_str(cls, dt: datetime, precision: int, tz=None) -> str:
-        if tz:
-            dt_in_user_timezone=dt.astimezone(pytz.timezone(tz))
+    @staticmethod
+    def obis_time_str(dt: datetime, precision: int, tz=None) -> str:
+        # datetimes already in the requested zone are used as is
+        if tz and str(dt.tzinfo) != tz:
+            dt_in_user_timezone = dt.astimezone(ZoneInfo(tz))
         else:
             dt_in_user_timezone = dt
-        if precision == 4:
-            return dt_in_user_timezone.strftime("%H%z")
-        elif precision == 5:
-            return dt_in_user_timezone.strftime("%H:%M%z")
-        elif precision == 6:
-            return dt_in_user_timezone.strftime("%H:%M:%S%z")
-        elif precision == 7:
-            return dt_in_user_timezone.strftime("%H:%M:%S.%f%z")
-        else:
+        fmt = _OBIS_TIME_FORMATS[precision] if precision in range(len(_OBIS_TIME_FORMATS)) else None
+        if fmt is None:
             raise ValueError("Precision not implemented")
+        return _strftime(dt_in_user_timezone, fmt)
+
+
+def obis_event_date(start_dt, start_dt_p: int, end_dt, end_dt_p: int, tz=None) -> str|None:
+    """dwc:eventDate of an Event, its start datetime or its start/end interval"""
+    if start_dt is None:
+        return None
+    start_dt_str = OBISTable.obis_datetime_str(start_dt, start_dt_p, tz=tz)
+    if end_dt is not None and end_dt != start_dt:
+        end_dt_str = OBISTable.obis_datetime_str(end_dt, end_dt_p, tz=tz)
+        return f"{start_dt_str}/{end_dt_str}"
+    return start_dt_str
+
+
+def obis_srs(*values) -> str|None:
+    """dwc:geodeticDatum / dwc:footprintSRS, WGS84 whenever one of the values it describes is set"""
+    if any(value is not None for value in values):
+        return "epsg:4326"
+    return None
 
 
 class Event(OBISTable):
     andes_object = None
-    datetime_precision_choices = [
-        (1, "year"),
-        (2, "month"),
-        (3, "day"),
-        (4, "hour"),
-        (5, "minute"),
-        (6, "second"),
-        (7, "millisecond"),
-    ]
-    
+    class Meta(OBISTable.Meta):
+        indexes = [
+            models.Index(fields=["_parentEvent", "_event_start_dt"], name="obis_event_parent_dt_idx"),
+        ]
+
     eventID = models.CharField(
         primary_key=True,
         max_length=255,
@@ -98,34 +188,27 @@ class Event(OBISTable):
         """parent EventID
         An identifier for the broader dwc:Event that groups this and potentially other dwc:Events
         """
-        if self._parentEvent:
-            return self._parentEvent.eventID
-        else:
-            return None
+        # the FK column already holds the parent eventID (primary key)
+        return self._parentEvent_id
     parentEventID.fget.short_description = "An identifier for the broader dwc:Event that groups this and potentially other dwc:Events"
 
-    @property
-    def eventDate(self) -> str:
+    @functools.cached_property
+    def eventDate(self) -> str|None:
         """Event Date
         http://rs.tdwg.org/dwc/terms/eventDate
 
         The date-time or interval during which a dwc:Event occurred. For occurrences, this is the date-time when the dwc:Event was recorded. Not suitable for a time in a geological context.
 
+        Computed once per instance, set the start/end datetimes before reading it.
         """
-        if self._event_start_dt and self._event_end_dt:
-            start_dt_str = OBISTable.obis_datetime_str(
-                self._event_start_dt, self._event_start_dt_p, tz=self.timezone
-            )
-            end_dt_str = OBISTable.obis_datetime_str(
-                self._event_end_dt, self._event_end_dt_p, tz=self.timezone
-            )
-            return f"{start_dt_str}/{end_dt_str}"
-        else:
-            start_dt_str = OBISTable.obis_datetime_str(
-                self._event_start_dt, self._event_start_dt_p, tz=self.timezone
-            )
-            return f"{start_dt_str}"
-    eventDate.fget.short_description = "The date-time or interval during which a dwc:Event occurred. For occurrences, this is the date-time when the dwc:Event was recorded. Not suitable for a time in a geological context."
+        return obis_event_date(
+            self._event_start_dt,
+            self._event_start_dt_p,
+            self._event_end_dt,
+            self._event_end_dt_p,
+            tz=self.timezone,
+        )
+    eventDate.short_description = "The date-time or interval during which a dwc:Event occurred. For occurrences, this is the date-time when the dwc:Event was recorded. Not suitable for a time in a geological context."
 
     _event_start_dt = models.DateTimeField(
         blank=True,
@@ -133,9 +216,9 @@ class Event(OBISTable):
         default=None,
         verbose_name="Private datetime variable for the start date",
     )
-    _event_start_dt_p = models.IntegerField(
+    _event_start_dt_p = models.PositiveSmallIntegerField(
         verbose_name="Private datetime variable for the start date precision",
-        choices=datetime_precision_choices,
+        choices=_DT_PRECISION_CHOICES,
         default=6,
     )
     _event_end_dt = models.DateTimeField(
@@ -144,46 +227,38 @@ class Event(OBISTable):
         default=None,
         verbose_name="Private datetime variable for the start date",
     )
-    _event_end_dt_p = models.IntegerField(
+    _event_end_dt_p = models.PositiveSmallIntegerField(
         verbose_name="Private datetime variable for the start date precision",
-        choices=datetime_precision_choices,
+        choices=_DT_PRECISION_CHOICES,
         default=6,
     )
-    decimalLatitude = models.DecimalField(
+    decimalLatitude = models.FloatField(
         blank=True,
         null=True,
         default=None,
-        decimal_places=6,
-        max_digits=8,
         verbose_name="The geographic latitude (in decimal degrees, using the spatial reference system given in dwc:geodeticDatum) of the geographic center of a dcterms:Location. Positive values are north of the Equator, negative values are south of it. Legal values lie between -90 and 90, inclusive.",
         help_text="http://rs.tdwg.org/dwc/terms/decimalLatitude"
     )
-    decimalLongitude = models.DecimalField(
+    decimalLongitude = models.FloatField(
         blank=True,
         null=True,
         default=None,
-        decimal_places=6,
-        max_digits=9,
         verbose_name="The geographic longitude (in decimal degrees, using the spatial reference system given in dwc:geodeticDatum) of the geographic center of a dcterms:Location. Positive values are east of the Greenwich Meridian, negative values are west of it. Legal values lie between -180 and 180, inclusive.",
         help_text="http://rs.tdwg.org/dwc/terms/decimalLongitude"
     )
 
-    coordinatePrecision = models.DecimalField(
+    coordinatePrecision = models.FloatField(
         blank=True,
         null=True,
         default=None,
-        decimal_places=6,
-        max_digits=7,
         verbose_name="A decimal representation of the precision of the coordinates given in the dwc:decimalLatitude and dwc:decimalLongitude.",
         help_text="http://rs.tdwg.org/dwc/terms/coordinatePrecision",
     )
 
-    coordinateUncertaintyInMeters = models.DecimalField(
+    coordinateUncertaintyInMeters = models.FloatField(
         blank=True,
         null=True,
         default=None,
-        decimal_places=6,
-        max_digits=12,
         verbose_name="The horizontal distance (in meters) from the given dwc:decimalLatitude and dwc:decimalLongitude describing the smallest circle containing the whole of the dcterms:Location. Leave the value empty if the uncertainty is unknown, cannot be estimated, or is not applicable (because there are no coordinates). Zero is not a valid value for this term.",
         help_text="http://rs.tdwg.org/dwc/terms/coordinateUncertaintyInMeters",
     )
@@ -194,59 +269,47 @@ class Event(OBISTable):
         Recommended best practice is to use the EPSG code of the SRS, if known. Otherwise use a controlled vocabulary for the name or code of the geodetic datum, if known. Otherwise use a controlled vocabulary for the name or code of the ellipsoid, if known. If none of these is known, use the value unknown. This term has an equivalent in the dwciri: namespace that allows only an IRI as a value, whereas this term allows for any string literal value.
         http://rs.tdwg.org/dwc/terms/geodeticDatum
         """
-        if self.decimalLongitude or self.decimalLatitude:
-            return "epsg:4326"
-        else:
-            return None
+        return obis_srs(self.decimalLongitude, self.decimalLatitude)
     geodeticDatum.fget.short_description = "The ellipsoid, geodetic datum, or spatial reference system (SRS) upon which the geographic coordinates given in dwc:decimalLatitude and dwc:decimalLongitude are based."
 
 
-    @property
+    @functools.cached_property
     def eventTime(self) -> str|None:
         """The time or interval during which a dwc:Event occurred.
         http://rs.tdwg.org/dwc/terms/eventTime
         """
-        if self._event_start_dt and self._event_end_dt:
-            start_dt_str = OBISTable.obis_time_str(
-                self._event_start_dt, self._event_start_dt_p, tz=self.timezone
-            )
+        start_dt = self._event_start_dt
+        if start_dt is None:
+            return None
+        end_dt = self._event_end_dt
+        tz = self.timezone
+        start_dt_str = OBISTable.obis_time_str(
+            start_dt, self._event_start_dt_p, tz=tz
+        )
+        if end_dt and end_dt != start_dt:
             end_dt_str = OBISTable.obis_time_str(
-                self._event_end_dt, self._event_end_dt_p, tz=self.timezone
+                end_dt, self._event_end_dt_p, tz=tz
             )
             return f"{start_dt_str}/{end_dt_str}"
-        elif self._event_start_dt:
-            start_dt_str = OBISTable.obis_time_str(
-                self._event_start_dt, self._event_start_dt_p, tz=self.timezone
-            )
-            return f"{start_dt_str}"
-        else:
-            return None
-    eventTime.fget.short_description = "The time or interval during which a dwc:Event occurred."
+        return start_dt_str
+    eventTime.short_description = "The time or interval during which a dwc:Event occurred."
 
     # @property
     # def month(self) -> str|None:
     #     """The integer month in which the dwc:Event occurred.
     #     http://rs.tdwg.org/dwc/terms/month
     #     """
-    #     if self._event_start_dt:
-    #         return self._event_start_dt.strftime("%m")
-    #     # elif self._event_end_dt:
-    #     #     return self._event_end_dt.strftime("%m")
-    #     else:
-    #         return None
+    #     start_dt = self._event_start_dt
+    #     return None if start_dt is None else f"{start_dt.month:02d}"
     # month.fget.short_description = "The integer month in which the dwc:Event occurred."
 
     @property
-    def year(self) -> str:
+    def year(self) -> str|None:
         """The four-digit year in which the dwc:Event occurred, according to the Common Era Calendar.
         http://rs.tdwg.org/dwc/terms/year
         """
-        if self._event_start_dt:
-            return self._event_start_dt.strftime("%Y")
-        # elif self._event_end_dt:
-        #     return self._event_end_dt.strftime("%Y")
-        else:
-            return None
+        start_dt = self._event_start_dt
+        return None if start_dt is None else f"{start_dt.year:04d}"
     year.fget.short_description = "The four-digit year in which the dwc:Event occurred, according to the Common Era Calendar."
 
     continent = models.CharField(
@@ -331,7 +394,7 @@ class Event(OBISTable):
     #     "A legal document giving official permission to do something with the resource."
     # )
 
-    license = models.CharField(
+    rightsHolder = models.CharField(
         blank=True,
         null=True,
         default=None,
@@ -448,10 +511,7 @@ class Event(OBISTable):
         Recommended best practice is to use the EPSG code of the SRS, if known. Otherwise use a controlled vocabulary for the name or code of the geodetic datum, if known. Otherwise use a controlled vocabulary for the name or code of the ellipsoid, if known. If none of these is known, use the value unknown. It is also permitted to provide the SRS in Well-Known-Text, especially if no EPSG code provides the necessary values for the attributes of the SRS. Do not use this term to describe the SRS of the dwc:decimalLatitude and dwc:decimalLongitude, nor of any verbatim coordinates - use the dwc:geodeticDatum and dwc:verbatimSRS instead. This term has an equivalent in the dwciri: namespace that allows only an IRI as a value, whereas this term allows for any string literal value.
         http://rs.tdwg.org/dwc/terms/footprintSRS
         """
-        if self.footprintWKT:
-            return "epsg:4326"
-        else:
-            return None
+        return obis_srs(self.footprintWKT)
     footprintSRS.fget.short_description = "The ellipsoid, geodetic datum, or spatial reference system (SRS) upon which the geometry given in dwc:footprintWKT is based."
 
     countryCode = models.CharField(
@@ -500,23 +560,25 @@ class Event(OBISTable):
         verbose_name="Comments or notes about the dwc:Event.",
     )
 
-    @property
+    @functools.cached_property
     def timezone(self) -> str:
+        # resolved once per instance, the parent chain is not walked again
         if isinstance(self.andes_object, Cruise):
             return self.andes_object.display_tz
         else:
             try:
                 return self._parentEvent.timezone
             except RecursionError:
-                logging.getLogger(__name__).error("All child Events needs to stem from a Cruise")
+                logger.error("All child Events needs to stem from a Cruise")
                 raise NoParentCruiseError
 
 
     def _init_from_cruise(self, cruise: Cruise):
         if not isinstance(cruise, Cruise):
             raise RuntimeError("_init_from_cruise needs a valid cruise")
-        logging.getLogger(__name__).debug("Making Event from Cruise object")
+        logger.debug("Making Event from Cruise object")
         self.andes_object = cruise
+        self.__dict__["timezone"] = cruise.display_tz
 
         self.eventID = cruise.mission_number
         self._event_start_dt = cruise.start_date
@@ -525,68 +587,60 @@ class Event(OBISTable):
         self._event_end_dt_p=3
 
         # use cruise bounding box
-        self.decimalLatitude = 0.5 * (cruise.max_lat + cruise.min_lat)
-        self.decimalLongitude = 0.5 * (cruise.max_lng + cruise.min_lng)
+        # plain float math, whatever numeric type the cruise bounds come back as
+        max_lat, min_lat = float(cruise.max_lat), float(cruise.min_lat)
+        max_lng, min_lng = float(cruise.max_lng), float(cruise.min_lng)
+        self.decimalLatitude = 0.5 * (max_lat + min_lat)
+        self.decimalLongitude = 0.5 * (max_lng + min_lng)
         # use half of great-circle distance (converted to metres)
         _coordinateUncertaintyInMeters = (
             1852
             * 0.5
             * calc_nautical_dist(
-                {"lat": cruise.max_lat, "lng": cruise.max_lng},
-                {"lat": cruise.min_lat, "lng": cruise.min_lng},
+                {"lat": max_lat, "lng": max_lng},
+                {"lat": min_lat, "lng": min_lng},
             )
         )
         self.coordinateUncertaintyInMeters = round(_coordinateUncertaintyInMeters, 3)
         self.fieldNumber = cruise.mission_number
         self.eventRemarks = cruise.notes
 
-        # Hard-coded values
-        self.eventType = "Project"  # https://registry.gbif-uat.org/vocabulary/EventType/concepts
-        self.continent = "North America"
-        self.language = "En"
-        self.coordinatePrecision = None
-        self.license = "http://creativecommons.org/licenses/by/4.0/legalcode"
-        self.rightsHolder = "His Majesty the King in right of Canada, as represented by the Minister of Fisheries and Oceans"
-        self.institutionID = "https://edmo.seadatanet.org/report/4160"
-        self.institutionCode = "IML"
-        self.datasetName = None
-        self.countryCode = "CA"
-        self.country = "Canada"
+        # Hard-coded values, all plain columns so they go straight in the instance dict
+        self.__dict__.update(_CRUISE_DEFAULTS)
+        return self
 
     def _init_from_fishing_set(self, my_set: Set):
         if not isinstance(my_set, Set):
             raise RuntimeError("_init_from_fishing_set needs a valid Set")
-        logging.getLogger(__name__).debug("Making Event from Set object")
+        logger.debug("Making Event from Set object")
 
-        if len(my_set.operations.filter(is_fishing=True)) == 0:
-            logging.getLogger(__name__).warning("%s has no fishing operations", my_set)
-            raise ValueError
+        # exporters annotate has_fishing_op on the Set queryset, otherwise ask the db
+        has_fishing_op = getattr(my_set, "has_fishing_op", None)
+        if has_fishing_op is None:
+            has_fishing_op = my_set.operations.filter(is_fishing=True).exists()
+        if not has_fishing_op:
+            logger.warning("Set %s has no fishing operations", my_set.set_number)
+            raise NoFishingOperation
 
         self.andes_object = my_set
-
-        def make_set_wkt(my_set: Set):
-            start_coord = (
-                my_set.start_longitude,
-                my_set.start_latitude,
-                my_set.start_depth_m,
-            )
-            end_coord = (my_set.end_longitude, my_set.end_latitude, my_set.end_depth_m)
-            ls = LineString((start_coord, end_coord))
-            return ls.wkt
+        self.__dict__["timezone"] = self._parentEvent.timezone
 
         self._event_start_dt = my_set.start_date
         self._event_end_dt = my_set.end_date
 
         # use set bounding box
-        self.decimalLatitude = 0.5 * (my_set.start_latitude + my_set.end_latitude)
-        self.decimalLongitude = 0.5 * (my_set.start_longitude + my_set.end_longitude)
+        # plain float math, whatever numeric type the set positions come back as
+        start_lat, end_lat = float(my_set.start_latitude), float(my_set.end_latitude)
+        start_lng, end_lng = float(my_set.start_longitude), float(my_set.end_longitude)
+        self.decimalLatitude = 0.5 * (start_lat + end_lat)
+        self.decimalLongitude = 0.5 * (start_lng + end_lng)
         # use half of great-circle distance (converted to metres)
         _coordinateUncertaintyInMeters = (
             1852
             * 0.5
             * calc_nautical_dist(
-                {"lat": my_set.start_latitude, "lng": my_set.start_longitude},
-                {"lat": my_set.end_latitude, "lng": my_set.end_longitude},
+                {"lat": start_lat, "lng": start_lng},
+                {"lat": end_lat, "lng": end_lng},
             )
         )
         self.coordinateUncertaintyInMeters = round(_coordinateUncertaintyInMeters, 3)
@@ -594,13 +648,46 @@ class Event(OBISTable):
         self.eventID = f"{self._parentEvent.eventID}-Set{my_set.set_number}"
         self.maximumDepthInMeters = my_set.max_depth_m if my_set.max_depth_m else None
         self.minimumDepthInMeters = my_set.min_depth_m if my_set.min_depth_m else None
-        self.footprintWKT = make_set_wkt(my_set)
+        # two point line, plain string formatting instead of a shapely round-trip
+        if my_set.start_depth_m is None or my_set.end_depth_m is None:
+            self.footprintWKT = (
+                f"LINESTRING ({my_set.start_longitude} {my_set.start_latitude}, "
+                f"{my_set.end_longitude} {my_set.end_latitude})"
+            )
+        else:
+            self.footprintWKT = (
+                f"LINESTRING Z ({my_set.start_longitude} {my_set.start_latitude} {my_set.start_depth_m}, "
+                f"{my_set.end_longitude} {my_set.end_latitude} {my_set.end_depth_m})"
+            )
         self.fieldNumber = my_set.station.name
 
         # hard-coded values
         self.eventType = (
             "SiteVisit"  # https://registry.gbif-uat.org/vocabulary/EventType/concepts
         )
+        return self
+
+    @classmethod
+    def bulk_from_sets(cls, sets, parent_event: "Event") -> list:
+        """
+        Make the Events of fishing sets under parent_event and insert them in batches.
+
+        Args:
+            sets: the Andes sets (an iterable or queryset)
+            parent_event (Event): the saved cruise Event
+
+        Returns:
+            list: the set Events, sets without fishing operations are skipped
+
+        """
+        events = []
+        for my_set in sets:
+            try:
+                events.append(cls(_parentEvent=parent_event)._init_from_fishing_set(my_set))
+            except NoFishingOperation:
+                continue
+        cls.bulk_upsert(events, batch_size=1000)
+        return events
 
     def _init_from_mixed_catch(self, catch: Catch):
         """
@@ -610,7 +697,7 @@ class Event(OBISTable):
             raise RuntimeError("_init_from_mixed_catch needs a Catch")
 
         if not catch.species.is_mixed_catch:
-            logging.getLogger(__name__).warning("%s needs to be a mixed catch", catch.id)
+            logger.warning("%s needs to be a mixed catch", catch.id)
             raise InvalidSpecies
 
         self.andes_object = catch
@@ -620,6 +707,11 @@ class Event(OBISTable):
 class Occurrence(OBISTable):
     andes_object = None
 
+    class Meta(OBISTable.Meta):
+        indexes = [
+            models.Index(fields=["_event", "scientificName"], name="obis_occurrence_event_name_idx"),
+        ]
+
     occurenceID = models.CharField(
         primary_key=True,
         max_length=255,
@@ -634,7 +726,7 @@ class Occurrence(OBISTable):
         An identifier for the set of information associated with a dwc:Event (something that occurs at a place and time). May be a global unique identifier or an identifier specific to the data set.
 
         """
-        return self._event.eventID
+        return self._event_id
 
     eventID.fget.short_description = "An identifier for the set of information associated with a dwc:Event (something that occurs at a place and time). May be a global unique identifier or an identifier specific to the data set."
 
@@ -651,32 +743,18 @@ class Occurrence(OBISTable):
         verbose_name="An identifier for the nomenclatural (not taxonomic) details of a scientific name.",
     )
 
-    @property
-    def basisOfRecord(self) ->str:
-        """	The specific nature of the data record.
-
-        http://rs.tdwg.org/dwc/terms/basisOfRecord
-
-    	Recommended best practice is to use a controlled vocabulary such as the set of local names of the identifiers for classes in Darwin Core.
-   
-        """
-        return "HumanObservation"
-    basisOfRecord.fget.short_description = "The specific nature of the data record."
+    # The specific nature of the data record.
+    # http://rs.tdwg.org/dwc/terms/basisOfRecord
+    # Recommended best practice is to use a controlled vocabulary such as the set of local names of the identifiers for classes in Darwin Core.
+    basisOfRecord = "HumanObservation"
     # basisOfRecord = models.CharField(
     #     max_length=63, verbose_name="The specific nature of the data record."
     # )
 
-    @property
-    def occurrenceStatus(self) ->str:
-        """A statement about the presence or absence of a dwc:Taxon at a dcterms:Location.
-
-        http://rs.tdwg.org/dwc/terms/occurrenceStatus
-
-        For dwc:Occurrences, the default vocabulary is recommended to consist of present and absent, but can be extended by implementers with good justification. This term has an equivalent in the dwciri: namespace that allows only an IRI as a value, whereas this term allows for any string literal value.
-
-        """
-        return "present"
-    occurrenceStatus.fget.short_description = "A statement about the presence or absence of a dwc:Taxon at a dcterms:Location."
+    # A statement about the presence or absence of a dwc:Taxon at a dcterms:Location.
+    # http://rs.tdwg.org/dwc/terms/occurrenceStatus
+    # For dwc:Occurrences, the default vocabulary is recommended to consist of present and absent, but can be extended by implementers with good justification. This term has an equivalent in the dwciri: namespace that allows only an IRI as a value, whereas this term allows for any string literal value.
+    occurrenceStatus = "present"
     # occurrenceStatus = models.CharField(
     #     max_length=63,
     #     verbose_name="A statement about the presence or absence of a dwc:Taxon at a dcterms:Location",
@@ -734,36 +812,46 @@ class Occurrence(OBISTable):
 # specificEpithet
 # taxonRank
 
+    @staticmethod
+    def is_exportable(catch: Catch) -> bool:
+        """
+        Whether a catch can become an Occurrence of its Set event, that is its species
+        is not a mixed catch and has an AphiaID. Exporters filter with this before
+        _init_from_catch, the catches skipped are logged here.
+        """
+        species = catch.species
+        if species.is_mixed_catch:
+            logger.warning("%s is a mixed catch, skipped", catch.id)
+            return False
+        if species.aphia_id is None:
+            logger.warning("%s does not have an AphiaID, skipped", catch.id)
+            return False
+        return True
+
     def _init_from_catch(self, catch: Catch):
         """
         Create an OBIS occurrence from a top level sampling event (a Set).
         Baskets having a parent baskets (poiting to a mixed catch) are ignored, they need to be populated using make_event_from_mixed_catch.
         Baskets that represent a subsample are ignored, they need a sub-sampling event.
+        The catch must pass is_exportable (not a mixed catch, has an aphiaID).
 
         Args:
             catch (Catch): The Andes catch that supports the occurence
             catch_idx (int): an integrer representing the catch index in this event
 
         Raises:
-            InvalidSpecies: If the catch species is mixed or does not have an aphiaID
             NoCatchData: If the catch is hollow (no actual data was inputed)
 
         """
         if not isinstance(catch, Catch):
             raise RuntimeError("_init_from_catch needs a Catch")
 
-        if catch.species.is_mixed_catch:
-            logging.getLogger(__name__).warning("%s is a mixed catch, skipped", catch.id)
-            raise InvalidSpecies
-
-        if catch.species.aphia_id is None:
-            logging.getLogger(__name__).warning(
-                "%s does not have an AphiaID, skipped", catch.id
-            )
-            raise InvalidSpecies
+        species = catch.species
+        scientific_name = species.scientific_name
+        aphia_id = species.aphia_id
 
         if catch.has_parent_baskets:
-            logging.getLogger(__name__).warning(
+            logger.warning(
                 "catch has parent baskets, perhaps a mixed catch?"
             )
 
@@ -784,27 +872,28 @@ class Occurrence(OBISTable):
             and (catch.unmeasured_specimen_count == 0)
             and (len(catch.specimens) == 0)
             and (len(catch.catch_images) == 0)
-            and catch.baskets.filter(children__isnull=False)
+            and catch.baskets.filter(children__isnull=False).exists()
         ):
 
-            logging.getLogger(__name__).warning(
+            logger.warning(
                 "%s does not contain meaningfull data to export, delete it and try again.",
                 catch,
             )
             raise NoCatchData("catch does not contain meaningfull data to export")
 
-        logging.getLogger(__name__).debug("Making Occurrence from Catch object")
+        logger.debug("Making Occurrence from Catch object")
 
         self.andes_object = catch
-        self.occurenceID = f"{self._event.eventID}_{self.andes_object.id}"
-        self.verbatimIdentification = catch.species.scientific_name
-        self.scientificName = catch.species.scientific_name
-        self.scientificNameID = f"urn:lsid:marinespecies.org:taxname:{catch.species.aphia_id}"
+        self.occurenceID = f"{self._event_id}_{catch.id}"
+        self.verbatimIdentification = scientific_name
+        self.scientificName = scientific_name
+        self.scientificNameID = _LSID_PREFIX + str(aphia_id)
 
         # hard-coded
         # self.basisOfRecord = "HumanObservation"
         # self.occurrenceStatus = "present"
-        self.associatedMedia = None,
+        self.associatedMedia = None
+        return self
     
 
 
@@ -1,5 +1,8 @@
-import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 from images.models import Image
@@ -7,53 +10,84 @@ from shared_models.models import Set
 from shared_models.utils import get_active_cruise
 from django.core.files.images import ImageFile
 
-def get_biigle_photos():
+_PHOTO_NAME = re.compile(r"^[^_]*_([^_]+)_(\d+)_.*\.jpg$")
+
+def get_biigle_photos(max_workers=16):
     email = "ENTER@EMAIL.COM"
     token = "MY_BIIGLE_TOKEN"
     headers = {'Accept': 'application/json'}
     auth = HTTPBasicAuth(email, token)
     base_url ="https://biigle.de/api"
 
+    # one session for all the requests so connections are reused,
+    # with a pool large enough for the download threads
+    session = requests.Session()
+    session.headers.update(headers)
+    session.auth = auth
+    session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
+
     volume_id = "VOLUME_ID"
     endpoint=f"/v1/volumes/{volume_id}/filenames"
     # get filenames
-    response = requests.get(f"{base_url}{endpoint}", headers=headers, auth=auth)
+    response = session.get(f"{base_url}{endpoint}")
 
 
     if not response.status_code==200: 
         print("bad response")
         exit()
 
-    for img_id, filename in response.json().items():
-        print(img_id)    
+    def download(img_id, filename):
+        endpoint = f"/v1/images/{img_id}/file"
+        # streamed to disk, images are never held in memory whole
+        with session.get(f"{base_url}{endpoint}", stream=True) as response:
+            response.raise_for_status()
+            with open(filename, 'wb') as fp:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    fp.write(chunk)
+        print(img_id)
         print(filename)
 
-        endpoint = f"/v1/images/{img_id}/file"
-        response = requests.get(f"{base_url}{endpoint}", headers=headers, auth=auth)
-        with open(filename, 'wb') as fp:
-            fp.write(response.content)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        downloads = [
+            executor.submit(download, img_id, filename)
+            for img_id, filename in response.json().items()
+        ]
+        for future in downloads:
+            future.result()
 
 
 def add_photos():
 
     cruise = get_active_cruise()
-    
-    for fname in glob.glob("andesOBIS/*.jpg"):
-        set_num = fname.split("_")[1]
-
-        # HACK for minagie
-        mission = fname.split("_")[1]
-        if mission=="16F":
-            exit()
-        set_num = fname.split("_")[2]
-
-        set = Set.objects.get(set_number=set_num, cruise=cruise)
-
-        with open(fname, 'rb') as fp:
-            image_file = ImageFile(fp)
-            if image_file:
-                image = Image(set=set, andes_uuid=set.uuid, type='set',image=image_file)
-                image.save(image_file.name, image_file)
+    # one query for all the sets
+    sets = {
+        set.set_number: set
+        for set in Set.objects.filter(cruise=cruise).only("id", "set_number", "uuid")
+    }
+
+    with os.scandir("andesOBIS") as entries:
+        for entry in entries:
+            # <prefix>_<mission>_<set number>_<...>.jpg
+            match = _PHOTO_NAME.match(entry.name)
+            if not match:
+                continue
+            mission, set_num = match.groups()
+            fname = entry.path
+
+            # HACK for minagie
+            if mission=="16F":
+                exit()
+
+            set = sets.get(int(set_num))
+            if set is None:
+                print(f"no set {set_num} for {fname}")
+                continue
+
+            with open(fname, 'rb') as fp:
+                image_file = ImageFile(fp)
+                if image_file:
+                    image = Image(set=set, andes_uuid=set.uuid, type='set',image=image_file)
+                    image.save(image_file.name, image_file)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,26 @@
-import logging
-
-from andesOBIS.models import Event, InvalidSpecies, Occurrence
-from shared_models.models import Cruise, Set, Operation
+import csv
+from datetime import timezone
+
+from django.db import transaction
+from django.db.models import Exists, F, FloatField, OuterRef, Prefetch, Q
+from django.db.models.functions import Cast, ExtractYear
+
+from andesOBIS.models import (
+    OBIS_INSTITUTION_CODE,
+    OBIS_INSTITUTION_ID,
+    OBIS_LANGUAGE,
+    OBIS_LICENSE,
+    OBIS_RIGHTS_HOLDER,
+    Event,
+    Occurrence,
+    obis_event_date,
+    obis_srs,
+)
+from shared_models.models import Cruise, Operation, Set
 from ecosystem_survey.models import Catch
 
 # from andesOBIS.forms import EventForm
 
-from shared_models.common_views import CommonCreateView
-from shared_models.mixins import AndesLeadRequiredMixin
-
-from shared_models.utils import get_active_cruise
 
 
 
@@ -20,46 +31,216 @@ from shared_models.utils import get_active_cruise
 #     form_class = EventForm
 
 
-def make_obis_events():
+OCCURRENCE_BATCH_SIZE = 1000
 
 
-    cruise = get_active_cruise()
+# one commit for the whole export, in the database OBISRouter sends the OBIS tables to
+@transaction.atomic(using="obisdb")
+def make_obis_events(cruise: Cruise):
+
     top_parent = Event()
     top_parent._init_from_cruise(cruise)
     top_parent.save()
 
-
-    for set in Set.objects.filter(cruise=cruise):
-        print(set)
-        if len(set.operations.filter(is_fishing=True)) == 0:
-            continue
-        set_event = Event(_parentEvent=top_parent)
-        set_event._init_from_fishing_set(set)
-        set_event.save()
-
-        for catch in Catch.objects.filter(set=set):
-
-            if catch.species.is_mixed_catch:
-                pass
-                # try:
-                #     occurrence = Occurrence(_event=set_event)
-                #     occurrence._init_from_mixed_catch(catch)
-                #     occurrence.save()
-                # except InvalidSpecies as exc:
-                #     print(exc)
-                #     pass
-            else:
-                try:
-                    occurrence = Occurrence(_event=set_event)
-                    occurrence._init_from_catch(catch)
-                    occurrence.save()
-                except InvalidSpecies as exc:
-                    print(exc)
-                    pass
-
-
-
-
-
-
-
+    # station is read for the fieldNumber of every set event, the catches of all
+    # the sets come in one extra query and their species in another, each species
+    # fetched (and instantiated) once however many catches share it
+    catches_accessor = Catch._meta.get_field("set").remote_field.get_accessor_name()
+    sets = (
+        Set.objects.filter(cruise=cruise)
+        .select_related("station")
+        # only the columns _init_from_fishing_set reads
+        .only(
+            "cruise",
+            "set_number",
+            "start_date",
+            "end_date",
+            "start_latitude",
+            "start_longitude",
+            "start_depth_m",
+            "end_latitude",
+            "end_longitude",
+            "end_depth_m",
+            "max_depth_m",
+            "min_depth_m",
+            "remarks",
+            "station__name",
+        )
+        .annotate(
+            has_fishing_op=Exists(Operation.objects.filter(set=OuterRef("pk"), is_fishing=True))
+        )
+        .prefetch_related(
+            Prefetch(
+                catches_accessor,
+                queryset=Catch.objects.prefetch_related("species"),
+                to_attr="export_catches",
+            )
+        )
+    )
+    set_events = Event.bulk_from_sets(sets, top_parent)
+    # set Events upserted by an earlier run whose set is no longer exported,
+    # their Occurrences cascade
+    Event.objects.filter(_parentEvent=top_parent).exclude(
+        eventID__in=[set_event.eventID for set_event in set_events]
+    ).delete()
+
+    occurrences = []
+    for set_event in set_events:
+        set = set_event.andes_object
+
+        for catch in set.export_catches:
+
+            # skipped catches (mixed, no AphiaID) are logged by is_exportable
+            if Occurrence.is_exportable(catch):
+                occurrences.append(Occurrence(_event=set_event)._init_from_catch(catch))
+            # mixed catches need a subsampling event:
+            # try:
+            #     occurrences.append(Occurrence(_event=set_event)._init_from_mixed_catch(catch))
+            # except InvalidSpecies as exc:
+            #     print(exc)
+            #     pass
+
+        # flush between sets, this only bounds the list of pending Occurrence inserts:
+        # the catches and species of the whole cruise are prefetched, and every Set
+        # stays referenced from its Event's andes_object
+        if len(occurrences) >= OCCURRENCE_BATCH_SIZE:
+            Occurrence.bulk_upsert(occurrences, batch_size=OCCURRENCE_BATCH_SIZE)
+            occurrences = []
+
+    Occurrence.bulk_upsert(occurrences, batch_size=OCCURRENCE_BATCH_SIZE)
+
+
+# Event table columns written to the OBIS event core, in order
+OBIS_EVENT_COLUMNS = (
+    "eventID",
+    "parentEventID",
+    "eventType",
+    "eventDate",
+    "year",
+    "decimalLatitude",
+    "decimalLongitude",
+    "geodeticDatum",
+    "coordinateUncertaintyInMeters",
+    "coordinatePrecision",
+    "footprintWKT",
+    "footprintSRS",
+    "minimumDepthInMeters",
+    "maximumDepthInMeters",
+    "fieldNumber",
+    "continent",
+    "countryCode",
+    "country",
+    "eventRemarks",
+    "datasetID",
+    "datasetName",
+    "language",
+    "license",
+    "rightsHolder",
+    "institutionID",
+    "institutionCode",
+)
+
+# Values of the trailing OBIS_EVENT_COLUMNS, the same on every row
+OBIS_EVENT_CONSTANTS = (
+    OBIS_LANGUAGE,
+    OBIS_LICENSE,
+    OBIS_RIGHTS_HOLDER,
+    OBIS_INSTITUTION_ID,
+    OBIS_INSTITUTION_CODE,
+)
+
+
+def _format_float(value: float | None, spec: str) -> str | None:
+    return None if value is None else format(value, spec)
+
+
+def write_obis_events(fp, cruise: Cruise):
+    """
+    Stream the Events of a cruise to fp as an OBIS event core (CSV).
+
+    Rows are read as tuples in chunks rather than as Event instances, so
+    parentEventID and year are projected by the database and the other
+    derived columns (eventDate, geodeticDatum, ...) use the helpers behind the
+    Event properties.
+
+    Args:
+        fp: a text file opened with newline=""
+        cruise (Cruise): the exported cruise, its display_tz is used to format the event dates
+    """
+    tz = cruise.display_tz
+    writer = csv.writer(fp)
+    writer.writerow(OBIS_EVENT_COLUMNS)
+
+    # the cruise Event and its set Events
+    rows = Event.objects.filter(
+        Q(eventID=cruise.mission_number) | Q(_parentEvent_id=cruise.mission_number)
+    ).annotate(
+        parentEventID=F("_parentEvent_id"),
+        # Event.year reads the stored (UTC) datetime
+        year=ExtractYear("_event_start_dt", tzinfo=timezone.utc),
+        # cast server side to skip building a Decimal per column and row
+        min_depth=Cast("minimumDepthInMeters", FloatField()),
+        max_depth=Cast("maximumDepthInMeters", FloatField()),
+    ).values_list(
+        "eventID",
+        "parentEventID",
+        "eventType",
+        "_event_start_dt",
+        "_event_start_dt_p",
+        "_event_end_dt",
+        "_event_end_dt_p",
+        "year",
+        "decimalLatitude",
+        "decimalLongitude",
+        "coordinateUncertaintyInMeters",
+        "coordinatePrecision",
+        "footprintWKT",
+        "min_depth",
+        "max_depth",
+        "fieldNumber",
+        "continent",
+        "countryCode",
+        "country",
+        "eventRemarks",
+        "datasetID",
+        "datasetName",
+    ).iterator(chunk_size=2000)
+
+    for (
+        event_id,
+        parent_event_id,
+        event_type,
+        start_dt,
+        start_dt_p,
+        end_dt,
+        end_dt_p,
+        year,
+        latitude,
+        longitude,
+        uncertainty,
+        precision,
+        footprint_wkt,
+        min_depth,
+        max_depth,
+        *location_and_dataset,
+    ) in rows:
+        writer.writerow(
+            [
+                event_id,
+                parent_event_id,
+                event_type,
+                obis_event_date(start_dt, start_dt_p, end_dt, end_dt_p, tz=tz),
+                year,
+                _format_float(latitude, ".6f"),
+                _format_float(longitude, ".6f"),
+                obis_srs(longitude, latitude),
+                _format_float(uncertainty, ".3f"),
+                _format_float(precision, ".6f"),
+                footprint_wkt,
+                obis_srs(footprint_wkt),
+                _format_float(min_depth, ".3f"),
+                _format_float(max_depth, ".3f"),
+                *location_and_dataset,
+                *OBIS_EVENT_CONSTANTS,
+            ]
+        )